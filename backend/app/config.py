@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from functools import lru_cache
+from functools import cached_property, lru_cache
 
 
 class Settings(BaseSettings):
@@ -7,12 +7,23 @@ class Settings(BaseSettings):
     
     # PostgreSQL (macOS Homebrew default: current user, no password)
     database_url: str = "postgresql://localhost:5432/aide"
-    db_pool_min_size: int = 2
-    db_pool_max_size: int = 10
+    # Practice requests hold a connection for schema setup and answer checks,
+    # so the pool is sized for several concurrent users
+    db_pool_min_size: int = 10
+    db_pool_max_size: int = 25
+    db_pool_max_inactive_lifetime: float = 300.0
+    db_statement_cache_size: int = 1024
     
     # Ollama LLM
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "qwen3:4b"
+    ollama_keep_alive: str = "30m"
+    # Send duplicate generations and keep the first valid one (needs spare Ollama capacity)
+    hedge_llm_requests: bool = False
+    # Reuse generated questions for identical prompts (0 disables; repeats questions)
+    question_cache_size: int = 0
+    # Questions to pre-generate per difficulty in the background (0 disables)
+    question_pool_size: int = 0
     
     # Query limits
     max_query_rows: int = 1000
@@ -22,6 +33,13 @@ class Settings(BaseSettings):
     max_practice_tables: int = 5
     max_practice_rows: int = 100
     rate_limit_per_minute: int = 3
+    max_active_sessions: int = 1000
+    session_ttl_seconds: int = 3600
+    
+    @cached_property
+    def database_url_public(self) -> str:
+        """Database URL with any credentials stripped, for display."""
+        return self.database_url.split("@")[-1] if "@" in self.database_url else self.database_url
     
     class Config:
         env_file = ".env"
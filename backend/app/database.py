@@ -17,6 +17,20 @@ def is_pool_available() -> bool:
     return _pool is not None
 
 
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register type codecs on each new pooled connection."""
+    # Decode uuid straight to its text form so result rows don't need a
+    # per-cell conversion. numeric keeps the default Decimal codec, since a
+    # float decoder would lose precision.
+    await conn.set_type_codec(
+        "uuid",
+        encoder=str,
+        decoder=str,
+        schema="pg_catalog",
+        format="text",
+    )
+
+
 async def create_pool() -> asyncpg.Pool:
     """Create the database connection pool."""
     global _pool
@@ -25,6 +39,10 @@ async def create_pool() -> asyncpg.Pool:
             dsn=settings.database_url,
             min_size=settings.db_pool_min_size,
             max_size=settings.db_pool_max_size,
+            max_inactive_connection_lifetime=settings.db_pool_max_inactive_lifetime,
+            command_timeout=settings.max_query_timeout_seconds,
+            statement_cache_size=settings.db_statement_cache_size,
+            init=_init_connection,
         )
     return _pool
 
@@ -1,12 +1,16 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.config import get_settings
 from app.database import create_pool, close_pool, is_pool_available
 from app.routers import sql, practice
+from app.services.llm import get_llm_client, close_llm_client
+from app.services.question_gen import start_question_prewarm
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -22,9 +26,17 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Could not connect to database: {e}")
         logger.warning("App will start but database features will be unavailable")
+    background_tasks = [
+        asyncio.create_task(practice.run_rate_limit_sweeper()),
+        asyncio.create_task(practice.run_session_sweeper()),
+        *start_question_prewarm(),
+    ]
     yield
-    # Shutdown: close database pool
+    # Shutdown: stop background tasks, close database pool and LLM HTTP client
+    for task in background_tasks:
+        task.cancel()
     await close_pool()
+    await close_llm_client()
 
 
 app = FastAPI(
@@ -32,17 +44,14 @@ app = FastAPI(
     description="Local SQL IDE with LLM-powered practice questions",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware for local development
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",  # Vite dev server
-        "http://localhost:3000",  # Alternative port
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:3000",
-    ],
+    # Vite dev server (5173) or alternative port (3000) on localhost/127.0.0.1
+    allow_origin_regex=r"^http://(localhost|127\.0\.0\.1):(5173|3000)$",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -62,12 +71,10 @@ async def root():
 @app.get("/health")
 async def health():
     """Detailed health check."""
-    from app.services.llm import llm_client
-    
     db_status = "connected" if is_pool_available() else "disconnected"
     
     try:
-        ollama_ok = await llm_client.is_available()
+        ollama_ok = await get_llm_client().is_available()
         ollama_status = "connected" if ollama_ok else "model not found"
     except Exception:
         ollama_status = "disconnected"
@@ -78,5 +85,5 @@ async def health():
         "status": overall,
         "database": db_status,
         "ollama": ollama_status,
-        "database_url": settings.database_url.split("@")[-1] if "@" in settings.database_url else settings.database_url,
+        "database_url": settings.database_url_public,
     }
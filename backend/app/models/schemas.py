@@ -18,6 +18,8 @@ class SQLExecuteResponse(BaseModel):
     success: bool
     columns: list[str] = Field(default_factory=list)
     rows: list[list[Any]] = Field(default_factory=list)
+    # Column-major results (one inner list per column); when set, rows is empty
+    column_data: list[list[Any]] | None = None
     row_count: int = 0
     truncated: bool = False
     error: str | None = None
@@ -1,8 +1,10 @@
+import asyncio
 import time
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
+from typing import Any
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 
 from app.config import get_settings
 from app.database import get_connection
@@ -14,41 +16,133 @@ from app.models.schemas import (
     CheckAnswerResponse,
     HintResponse,
     Question,
+    SQLExecuteResponse,
 )
 from app.services.question_gen import generate_question, generate_custom_question, generate_schema_name
-from app.services.sql_executor import execute_query, execute_setup_sql, validate_schema_name
+from app.services.sql_executor import (
+    execute_query,
+    execute_setup_sql,
+    quote_ident,
+    validate_schema_name,
+)
 
 settings = get_settings()
 router = APIRouter(prefix="/practice", tags=["practice"])
 
-# In-memory storage for active sessions
+# In-memory storage for active sessions, least recently used first
 # In production, use Redis or a database
-_active_sessions: dict[str, dict] = {}
+_active_sessions: OrderedDict[str, dict] = OrderedDict()
+
+# Keep references to fire-and-forget schema drops until they finish
+_pending_drops: set[asyncio.Task] = set()
+
+SESSION_SWEEP_INTERVAL_SECONDS = 300
+
+# Rate limiting: track generation requests per client
+_rate_limits: dict[str, deque[float]] = defaultdict(deque)
+
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SWEEP_INTERVAL_SECONDS = 60
 
-# Rate limiting: track generation requests per session
-_rate_limits: dict[str, list[float]] = defaultdict(list)
 
+def _client_key(http_request: Request) -> str:
+    """Identify the caller for rate limiting."""
+    return http_request.client.host if http_request.client else "unknown"
 
-def _check_rate_limit(session_id: str) -> bool:
-    """Check if session has exceeded rate limit."""
+
+def _check_rate_limit(client_key: str) -> bool:
+    """Check if client has exceeded rate limit."""
     now = time.time()
-    window_start = now - 60  # 1 minute window
+    window_start = now - RATE_LIMIT_WINDOW_SECONDS
     
-    # Clean old entries
-    _rate_limits[session_id] = [
-        t for t in _rate_limits[session_id] if t > window_start
-    ]
+    timestamps = _rate_limits[client_key]
     
-    if len(_rate_limits[session_id]) >= settings.rate_limit_per_minute:
+    # Clean old entries (timestamps are appended in order, so expired ones are at the head)
+    while timestamps and timestamps[0] <= window_start:
+        timestamps.popleft()
+    
+    if len(timestamps) >= settings.rate_limit_per_minute:
         return False
     
-    _rate_limits[session_id].append(now)
+    timestamps.append(now)
     return True
 
 
+def _sweep_rate_limits() -> None:
+    """Drop clients with no requests inside the current window."""
+    window_start = time.time() - RATE_LIMIT_WINDOW_SECONDS
+    for key in list(_rate_limits):
+        timestamps = _rate_limits[key]
+        while timestamps and timestamps[0] <= window_start:
+            timestamps.popleft()
+        if not timestamps:
+            del _rate_limits[key]
+
+
+async def run_rate_limit_sweeper() -> None:
+    """Background task that keeps _rate_limits from growing without bound."""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_SWEEP_INTERVAL_SECONDS)
+        _sweep_rate_limits()
+
+
+async def _drop_schema(schema_name: str) -> None:
+    """Drop a practice schema, ignoring failures (it may already be gone)."""
+    if not validate_schema_name(schema_name):
+        return
+    try:
+        async with get_connection() as conn:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {quote_ident(schema_name)} CASCADE")
+    except Exception:
+        pass
+
+
+def _evict_session(session_id: str) -> None:
+    """Remove a session and drop its schema in the background."""
+    session = _active_sessions.pop(session_id)
+    task = asyncio.create_task(_drop_schema(session["schema_name"]))
+    _pending_drops.add(task)
+    task.add_done_callback(_pending_drops.discard)
+
+
+def _store_session(session_id: str, session: dict) -> None:
+    """Store a new session, evicting the least recently used beyond the cap."""
+    _active_sessions[session_id] = session
+    while len(_active_sessions) > settings.max_active_sessions:
+        _evict_session(next(iter(_active_sessions)))
+
+
+def _get_session(session_id: str) -> dict | None:
+    """Look up a session and mark it as recently used."""
+    session = _active_sessions.get(session_id)
+    if session is not None:
+        _active_sessions.move_to_end(session_id)
+    return session
+
+
+def _sweep_sessions() -> None:
+    """Evict sessions older than the configured TTL."""
+    cutoff = time.time() - settings.session_ttl_seconds
+    expired = [
+        session_id
+        for session_id, session in _active_sessions.items()
+        if session["created_at"] < cutoff
+    ]
+    for session_id in expired:
+        _evict_session(session_id)
+
+
+async def run_session_sweeper() -> None:
+    """Background task that expires abandoned sessions and their schemas."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        _sweep_sessions()
+
+
 @router.post("/generate", response_model=GenerateQuestionResponse)
 async def generate_practice_question(
     request: GenerateQuestionRequest,
+    http_request: Request,
 ) -> GenerateQuestionResponse:
     """
     Generate a new practice question with dataset.
@@ -56,11 +150,8 @@ async def generate_practice_question(
     Creates an isolated schema, sets up tables, and returns the question.
     Rate limited to prevent LLM overload.
     """
-    # Generate or use existing session ID
-    session_id = str(uuid4())
-    
-    # Check rate limit
-    if not _check_rate_limit(session_id):
+    # Check rate limit (keyed on the client, not the per-question session)
+    if not _check_rate_limit(_client_key(http_request)):
         raise HTTPException(
             status_code=429,
             detail=f"Rate limit exceeded. Maximum {settings.rate_limit_per_minute} questions per minute.",
@@ -81,6 +172,7 @@ async def generate_practice_question(
         )
     
     # Create isolated schema and set up tables
+    session_id = str(uuid4())
     schema_name = generate_schema_name()
     
     async with get_connection() as conn:
@@ -95,14 +187,23 @@ async def generate_practice_question(
                 status_code=500,
                 detail=f"Failed to set up practice database: {error}",
             )
+        
+        # Run the expected query once now; every answer check reuses the result
+        expected_result = await execute_query(
+            conn=conn,
+            query=question.expected_query,
+            schema_name=schema_name,
+        )
     
     # Store session data
-    _active_sessions[session_id] = {
+    session = {
         "schema_name": schema_name,
         "question": question,
         "hints_revealed": 0,
         "created_at": time.time(),
     }
+    _cache_expected_result(session, expected_result)
+    _store_session(session_id, session)
     
     return GenerateQuestionResponse(
         question=question,
@@ -114,10 +215,9 @@ async def generate_practice_question(
 @router.post("/generate-custom", response_model=GenerateQuestionResponse)
 async def generate_custom_practice_question(
     request: GenerateCustomQuestionRequest,
+    http_request: Request,
 ) -> GenerateQuestionResponse:
-    session_id = str(uuid4())
-
-    if not _check_rate_limit(session_id):
+    if not _check_rate_limit(_client_key(http_request)):
         raise HTTPException(
             status_code=429,
             detail=f"Rate limit exceeded. Maximum {settings.rate_limit_per_minute} questions per minute.",
@@ -133,6 +233,7 @@ async def generate_custom_practice_question(
             detail=f"Failed to generate question. Is Ollama running? Error: {str(e)}",
         )
 
+    session_id = str(uuid4())
     schema_name = generate_schema_name()
 
     async with get_connection() as conn:
@@ -148,12 +249,21 @@ async def generate_custom_practice_question(
                 detail=f"Failed to set up practice database: {error}",
             )
 
-    _active_sessions[session_id] = {
+        # Run the expected query once now; every answer check reuses the result
+        expected_result = await execute_query(
+            conn=conn,
+            query=question.expected_query,
+            schema_name=schema_name,
+        )
+
+    session = {
         "schema_name": schema_name,
         "question": question,
         "hints_revealed": 0,
         "created_at": time.time(),
     }
+    _cache_expected_result(session, expected_result)
+    _store_session(session_id, session)
 
     return GenerateQuestionResponse(
         question=question,
@@ -162,6 +272,39 @@ async def generate_custom_practice_question(
     )
 
 
+def _normalize_rows(rows: list[list]) -> Counter:
+    """Count rows as hashable tuples so duplicate rows are compared too."""
+    try:
+        return Counter(map(tuple, rows))
+    except TypeError:
+        # Array/JSON cells come back as lists/dicts
+        return Counter(tuple(_hashable(v) for v in row) for row in rows)
+
+
+def _hashable(value: Any) -> Any:
+    """Convert nested lists/dicts into tuples."""
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _cache_expected_result(session: dict, expected_result: SQLExecuteResponse) -> None:
+    """Store a successful expected-query result (and its row counts) on the session."""
+    if expected_result.success:
+        session["expected_result"] = expected_result
+        session["expected_row_counts"] = _normalize_rows(expected_result.rows)
+
+
+async def _run_query(query: str, schema_name: str) -> SQLExecuteResponse:
+    """Execute a query on its own pooled connection."""
+    # Each query acquires separately so concurrent checks never hold one
+    # connection while waiting for a second
+    async with get_connection() as conn:
+        return await execute_query(conn=conn, query=query, schema_name=schema_name)
+
+
 @router.post("/check", response_model=CheckAnswerResponse)
 async def check_answer(request: CheckAnswerRequest) -> CheckAnswerResponse:
     """
@@ -173,7 +316,7 @@ async def check_answer(request: CheckAnswerRequest) -> CheckAnswerResponse:
     if not validate_schema_name(request.schema_name):
         raise HTTPException(status_code=400, detail="Invalid schema name format")
     
-    session = _active_sessions.get(request.session_id)
+    session = _get_session(request.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -182,51 +325,47 @@ async def check_answer(request: CheckAnswerRequest) -> CheckAnswerResponse:
     
     question: Question = session["question"]
     
-    async with get_connection() as conn:
-        # Execute user's query
-        user_result = await execute_query(
-            conn=conn,
-            query=request.query,
-            schema_name=request.schema_name,
+    # The expected result is cached on the session after the first run
+    expected_result: SQLExecuteResponse | None = session.get("expected_result")
+    if expected_result is None:
+        # Execute user's and expected queries concurrently
+        user_result, expected_result = await asyncio.gather(
+            _run_query(request.query, request.schema_name),
+            _run_query(question.expected_query, request.schema_name),
         )
-        
-        if not user_result.success:
-            return CheckAnswerResponse(
-                correct=False,
-                error=user_result.error,
-            )
-        
-        # Execute expected query
-        expected_result = await execute_query(
-            conn=conn,
-            query=question.expected_query,
-            schema_name=request.schema_name,
+        _cache_expected_result(session, expected_result)
+    else:
+        user_result = await _run_query(request.query, request.schema_name)
+    
+    if not user_result.success:
+        return CheckAnswerResponse(
+            correct=False,
+            error=user_result.error,
         )
-        
-        if not expected_result.success:
-            # This shouldn't happen if question was validated
-            return CheckAnswerResponse(
-                correct=False,
-                error=f"Internal error: expected query failed - {expected_result.error}",
-            )
     
-    # Compare results
-    # Normalize for comparison (convert to sorted tuples for order-independent comparison)
-    def normalize_rows(rows: list, columns: list) -> set:
-        return set(tuple(str(v) for v in row) for row in rows)
+    if not expected_result.success:
+        # This shouldn't happen if question was validated
+        return CheckAnswerResponse(
+            correct=False,
+            error=f"Internal error: expected query failed - {expected_result.error}",
+        )
     
-    user_set = normalize_rows(user_result.rows, user_result.columns)
-    expected_set = normalize_rows(expected_result.rows, expected_result.columns)
+    # Compare results as order-independent multisets of rows
+    user_rows = _normalize_rows(user_result.rows)
+    expected_rows = session["expected_row_counts"]
     
     # Check column names match (case-insensitive)
     user_cols_lower = [c.lower() for c in user_result.columns]
     expected_cols_lower = [c.lower() for c in expected_result.columns]
     
     columns_match = user_cols_lower == expected_cols_lower
-    rows_match = user_set == expected_set
+    rows_match = user_rows == expected_rows
     
     correct = columns_match and rows_match
-    row_diff = len(user_set.symmetric_difference(expected_set))
+    row_diff = (
+        sum((user_rows - expected_rows).values())
+        + sum((expected_rows - user_rows).values())
+    )
     
     return CheckAnswerResponse(
         correct=correct,
@@ -245,7 +384,7 @@ async def get_hint(session_id: str) -> HintResponse:
     
     Reveals hints progressively - each call reveals one more hint.
     """
-    session = _active_sessions.get(session_id)
+    session = _get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -279,11 +418,12 @@ async def cleanup_session(session_id: str) -> dict:
     
     async with get_connection() as conn:
         try:
-            await conn.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
+            await conn.execute(f"DROP SCHEMA IF EXISTS {quote_ident(schema_name)} CASCADE")
         except Exception:
             # Log but don't fail - schema might already be cleaned
             pass
     
-    del _active_sessions[session_id]
+    # May already have been evicted while the DROP was in flight
+    _active_sessions.pop(session_id, None)
     
     return {"status": "cleaned", "schema_name": schema_name}
@@ -15,6 +15,7 @@ async def execute_sql(request: SQLExecuteRequest) -> SQLExecuteResponse:
     - Queries are read-only by default (SELECT only)
     - Results are limited to prevent memory issues
     - Timeout is enforced to prevent long-running queries
+    - Large results are returned column-major in column_data
     """
     query = request.query.strip()
     
@@ -44,6 +45,7 @@ async def execute_sql(request: SQLExecuteRequest) -> SQLExecuteResponse:
             conn=conn,
             query=query,
             schema_name=request.schema_name,
+            columnar=True,
         )
     
     return result
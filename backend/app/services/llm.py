@@ -1,6 +1,8 @@
 import httpx
+import orjson
 import re
-from typing import Any
+from functools import lru_cache
+from typing import Any, AsyncIterator
 
 from app.config import get_settings
 
@@ -9,6 +11,11 @@ settings = get_settings()
 
 DEFAULT_MODEL = settings.ollama_model
 
+# Patterns used by extract_json, compiled once at import
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*(?=[}\]])")
+_CODE_BLOCK_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```")
+
 
 class OllamaClient:
     """Async client for Ollama LLM API. Uses qwen3:4b exclusively."""
@@ -23,6 +30,28 @@ class OllamaClient:
         # Allow caller or env to choose model; fall back to configured default
         self.model = model or DEFAULT_MODEL
         self.timeout = timeout
+        # Long-lived client so connections to Ollama are kept alive between calls
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+        )
+    
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client."""
+        await self._client.aclose()
+    
+    async def _stream(self, path: str, payload: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+        """POST to a streaming Ollama endpoint and yield each NDJSON chunk."""
+        async with self._client.stream("POST", path, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                yield chunk
     
     async def generate(
         self,
@@ -30,6 +59,7 @@ class OllamaClient:
         system: str | None = None,
         temperature: float = 0.7,
         max_tokens: int = 768,
+        json_schema: dict[str, Any] | None = None,
     ) -> str:
         """
         Generate text using Ollama.
@@ -39,6 +69,7 @@ class OllamaClient:
             system: Optional system prompt
             temperature: Sampling temperature (0-1)
             max_tokens: Maximum tokens to generate
+            json_schema: Optional JSON Schema to constrain the output to
         
         Returns:
             Generated text response
@@ -46,7 +77,9 @@ class OllamaClient:
         payload: dict[str, Any] = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": True,
+            # Keep the model (and its prompt cache) loaded between requests
+            "keep_alive": settings.ollama_keep_alive,
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
@@ -55,17 +88,15 @@ class OllamaClient:
         
         if system:
             payload["system"] = system
-        # Ensure JSON-only output which avoids 'thinking' field confusion
-        payload["format"] = "json"
+        # Ensure JSON-only output which avoids 'thinking' field confusion.
+        # With a schema, Ollama constrains decoding to that exact structure.
+        payload["format"] = json_schema or "json"
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                f"{self.base_url}/api/generate",
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("response", "")
+        # Stream tokens as they are produced instead of waiting for the full body
+        parts: list[str] = []
+        async for chunk in self._stream("/api/generate", payload):
+            parts.append(chunk.get("response", ""))
+        return "".join(parts)
     
     async def chat(
         self,
@@ -87,7 +118,8 @@ class OllamaClient:
         payload = {
             "model": self.model,
             "messages": messages,
-            "stream": False,
+            "stream": True,
+            "keep_alive": settings.ollama_keep_alive,
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
@@ -96,35 +128,90 @@ class OllamaClient:
         # Ensure JSON-only output for chat mode as well
         payload["format"] = "json"
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                f"{self.base_url}/api/chat",
-                json=payload,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("message", {}).get("content", "")
+        parts: list[str] = []
+        async for chunk in self._stream("/api/chat", payload):
+            parts.append(chunk.get("message", {}).get("content", ""))
+        return "".join(parts)
     
     async def is_available(self) -> bool:
         """Check if Ollama is running and qwen3:4b is available."""
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                if response.status_code != 200:
-                    return False
-                
-                data = response.json()
-                models = [m.get("name", "") for m in data.get("models", [])]
-                # Check specifically for qwen3:4b
-                return any("qwen3:4b" in m or m == "qwen3:4b" for m in models)
+            response = await self._client.get("/api/tags", timeout=5.0)
+            if response.status_code != 200:
+                return False
+            
+            data = orjson.loads(response.content)
+            models = [m.get("name", "") for m in data.get("models", [])]
+            # Check specifically for qwen3:4b
+            return any("qwen3:4b" in m or m == "qwen3:4b" for m in models)
         except Exception:
             return False
 
 
+def _find_json_object(text: str) -> str | None:
+    """
+    Return the first balanced {...} object in text, or None.
+
+    Single linear pass; braces inside JSON strings are ignored.
+    """
+    start = -1
+    depth = 0
+    in_string = False
+    escape = False
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if depth:
+                in_string = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+
+    return None
+
+
 def extract_json(text: str) -> str:
     """
     Extract JSON from LLM response, handling markdown code blocks.
     
+    Args:
+        text: Raw LLM response that may contain JSON
+    
+    Returns:
+        Extracted JSON string
+    
+    Raises:
+        ValueError: If no valid JSON found
+    """
+    # Fast path: with format=json the whole response is usually valid JSON
+    try:
+        if isinstance(orjson.loads(text), dict):
+            return text
+    except orjson.JSONDecodeError:
+        pass
+    
+    return extract_embedded_json(text)
+
+
+def extract_embedded_json(text: str) -> str:
+    """
+    Extract JSON embedded in surrounding text, without first trying to parse
+    the whole response.
+    
+    For callers that have already tried parsing the response directly.
+    
     Args:
         text: Raw LLM response that may contain JSON
     
@@ -135,25 +222,34 @@ def extract_json(text: str) -> str:
         ValueError: If no valid JSON found
     """
     # Remove thinking tags from qwen3 if present
-    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    text = _THINK_RE.sub("", text)
     
     # Helper to strip trailing commas that often break JSON parse
     def _remove_trailing_commas(txt: str) -> str:
         # comma followed by optional whitespace and either }} or ]]
-        return re.sub(r",\s*(?=[}\]])", "", txt)
+        return _TRAILING_COMMA_RE.sub("", txt)
 
     # Try to find JSON in code blocks first
-    code_block_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
+    code_block_match = _CODE_BLOCK_RE.search(text)
     if code_block_match:
         return _remove_trailing_commas(code_block_match.group(1).strip())
     
     # Try to find raw JSON object
-    json_match = re.search(r"\{[\s\S]*\}", text)
-    if json_match:
-        return _remove_trailing_commas(json_match.group(0))
+    json_obj = _find_json_object(text)
+    if json_obj is not None:
+        return _remove_trailing_commas(json_obj)
     
     raise ValueError("No JSON found in response")
 
 
-# Default client instance
-llm_client = OllamaClient()
+@lru_cache
+def get_llm_client() -> OllamaClient:
+    """Return the shared client, creating it on first use."""
+    return OllamaClient()
+
+
+async def close_llm_client() -> None:
+    """Close the shared client if it was ever created."""
+    if get_llm_client.cache_info().currsize:
+        await get_llm_client().aclose()
+        get_llm_client.cache_clear()
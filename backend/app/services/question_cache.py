@@ -0,0 +1,49 @@
+import hashlib
+from collections import OrderedDict
+
+from app.config import get_settings
+from app.models.schemas import Question
+
+settings = get_settings()
+
+
+class QuestionCache:
+    """
+    In-process LRU cache of generated questions, keyed on the exact prompt.
+
+    Questions are stored as serialized JSON so every hit returns a fresh
+    Question object. A max_entries of 0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+
+    @staticmethod
+    def _key(prompt: str) -> bytes:
+        return hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+
+    def get(self, prompt: str) -> Question | None:
+        """Return the cached question for this prompt, if any."""
+        if not self.max_entries:
+            return None
+        key = self._key(prompt)
+        data = self._entries.get(key)
+        if data is None:
+            return None
+        self._entries.move_to_end(key)
+        return Question.model_validate_json(data)
+
+    def put(self, prompt: str, question: Question) -> None:
+        """Store a generated question, evicting the least recently used entry."""
+        if not self.max_entries:
+            return
+        key = self._key(prompt)
+        self._entries[key] = question.model_dump_json()
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Default cache instance
+question_cache = QuestionCache(settings.question_cache_size)
@@ -1,11 +1,15 @@
-import json
+import asyncio
+import orjson
 import random
-import re
+from functools import lru_cache
 from uuid import uuid4
 
+from pydantic import TypeAdapter
+
 from app.config import get_settings
 from app.models.schemas import Question, Difficulty, TableSchema
-from app.services.llm import llm_client, extract_json
+from app.services.llm import get_llm_client, extract_embedded_json
+from app.services.question_cache import question_cache
 
 settings = get_settings()
 
@@ -65,6 +69,31 @@ FEW_SHOTS = {
 }"""
 }
 
+# Fields every generated question must contain
+_REQUIRED_FIELDS = frozenset((
+    "title",
+    "description",
+    "tables",
+    "setup_sql",
+    "expected_query",
+    "expected_columns",
+    "hints",
+))
+
+# Pre-generated questions per difficulty, filled by start_question_prewarm()
+_pools: dict[Difficulty, asyncio.Queue[Question]] = {}
+pool_stats = {"hits": 0, "misses": 0}
+PREWARM_RETRY_DELAY_SECONDS = 30
+
+# JSON Schema passed to Ollama so decoding is constrained to a valid Question
+QUESTION_JSON_SCHEMA = Question.model_json_schema()
+
+# Validator for the tables list of a parsed response
+_TABLES_ADAPTER = TypeAdapter(list[TableSchema])
+
+# Max tables per generated question, by difficulty
+MAX_TABLES = {"easy": 1, "medium": 3, "hard": 5}
+
 # Difficulty guide for prompts
 DIFFICULTY_GUIDE = {
     "easy": "Single table, basic SELECT/WHERE/ORDER BY",
@@ -97,14 +126,13 @@ CONSTRAINTS:
 - Match the difficulty/topic requested by the user"""
 
 
-def build_prompt(difficulty: str, domain: str) -> str:
-    """Build the question generation prompt."""
-    max_tables = {"easy": 1, "medium": 3, "hard": 5}.get(difficulty, 3)
+def _prompt_prefix(difficulty: str) -> str:
+    """Render the static part of the prompt for a difficulty."""
+    max_tables = MAX_TABLES[difficulty]
     
     return f"""Generate a SQL practice question.
 
-DIFFICULTY: {difficulty} ({DIFFICULTY_GUIDE.get(difficulty)})
-DOMAIN: {domain}
+DIFFICULTY: {difficulty} ({DIFFICULTY_GUIDE[difficulty]})
 
 OUTPUT FORMAT (JSON only):
 {{
@@ -123,7 +151,110 @@ CONSTRAINTS:
 - Valid PostgreSQL 14 syntax
 
 EXAMPLE ({difficulty}):
-{FEW_SHOTS.get(difficulty, FEW_SHOTS["medium"])}"""
+{FEW_SHOTS[difficulty]}"""
+
+
+# Static prompt prefix per difficulty, rendered once at import. The domain is
+# appended last so every prompt for a difficulty shares a byte-identical
+# prefix, which lets Ollama reuse the cached KV state for it between calls.
+_PROMPT_PREFIXES = {difficulty: _prompt_prefix(difficulty) for difficulty in FEW_SHOTS}
+
+
+@lru_cache(maxsize=len(DOMAINS) * len(_PROMPT_PREFIXES))
+def build_prompt(difficulty: str, domain: str) -> str:
+    """Build the question generation prompt."""
+    return f"{_PROMPT_PREFIXES[difficulty]}\n\nDOMAIN: {domain}"
+
+
+RETRY_INSTRUCTIONS = """Please fix the issue and regenerate. Remember:
+- Output ONLY valid JSON
+- Ensure all SQL statements are valid PostgreSQL 14
+- Make sure expected_query actually works with the setup_sql schema"""
+
+
+def build_retry_prompt(prompt: str, last_error: str) -> str:
+    """
+    Append the previous error to a prompt for a retry.
+    
+    The error goes after the original prompt so its bytes stay a prefix of the
+    retry prompt and the LLM's prompt cache still applies.
+    """
+    return "\n\n".join((
+        prompt,
+        f"The previous attempt had an error: {last_error}",
+        RETRY_INSTRUCTIONS,
+    ))
+
+
+def _parse_question(raw_response: str) -> Question:
+    """Extract, validate and build a Question from a raw LLM response."""
+    # Parse JSON directly when the response is already a bare object (the
+    # common case with constrained decoding); otherwise extract it, skipping
+    # extract_json's own whole-text parse since that just failed here
+    try:
+        data = orjson.loads(raw_response)
+    except orjson.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict):
+        data = orjson.loads(extract_embedded_json(raw_response))
+    
+    # Validate required fields
+    missing = _REQUIRED_FIELDS.difference(data)
+    if missing:
+        raise ValueError(f"Missing required fields: {sorted(missing)}")
+    
+    # Parse tables in a single validation pass
+    tables = _TABLES_ADAPTER.validate_python(data["tables"])
+    
+    return Question(
+        title=data["title"],
+        description=data["description"],
+        tables=tables,
+        setup_sql=data["setup_sql"],
+        expected_query=data["expected_query"],
+        expected_columns=data["expected_columns"],
+        hints=data["hints"],
+    )
+
+
+async def _generate_once(prompt: str) -> Question:
+    """Make a single LLM call and parse its response."""
+    raw_response = await get_llm_client().generate(
+        prompt=prompt,
+        system=SYSTEM_PROMPT,
+        temperature=0.7,
+        json_schema=QUESTION_JSON_SCHEMA,
+    )
+    return _parse_question(raw_response)
+
+
+async def _generate_hedged(prompt: str, copies: int = 2) -> Question:
+    """
+    Issue several identical generations and return the first that parses.
+    
+    Ollama samples each request independently, so the copies produce different
+    outputs; the slower ones are cancelled as soon as one succeeds.
+    """
+    pending = {asyncio.create_task(_generate_once(prompt)) for _ in range(copies)}
+    last_exc: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_exc = task.exception()
+        raise last_exc
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _request_question(prompt: str) -> Question:
+    """Generate and parse one question, hedging the LLM call if enabled."""
+    if settings.hedge_llm_requests:
+        return await _generate_hedged(prompt)
+    return await _generate_once(prompt)
 
 
 async def generate_question(
@@ -145,66 +276,40 @@ async def generate_question(
     Raises:
         ValueError: If generation fails after all retries
     """
+    # Serve a pre-generated question when the caller has no domain preference
+    if domain is None and difficulty in _pools:
+        try:
+            question = _pools[difficulty].get_nowait()
+            pool_stats["hits"] += 1
+            return question
+        except asyncio.QueueEmpty:
+            pool_stats["misses"] += 1
+    
     domain = domain or random.choice(DOMAINS)
     prompt = build_prompt(difficulty.value, domain)
     
+    # Reuse a previous question for the same prompt if caching is enabled
+    cached = question_cache.get(prompt)
+    if cached is not None:
+        return cached
+    
+    question = await _generate_fresh(prompt, max_retries)
+    question_cache.put(prompt, question)
+    return question
+
+
+async def _generate_fresh(prompt: str, max_retries: int = 2) -> Question:
+    """Call the LLM for a question, retrying with the last error as context."""
     last_error: str | None = None
     
     for attempt in range(max_retries + 1):
         try:
             # Add error context for retries
             if attempt > 0 and last_error:
-                retry_prompt = f"""The previous attempt had an error: {last_error}
-
-Please fix the issue and regenerate. Remember:
-- Output ONLY valid JSON
-- Ensure all SQL statements are valid PostgreSQL 14
-- Make sure expected_query actually works with the setup_sql schema
-
-{prompt}"""
-                raw_response = await llm_client.generate(
-                    prompt=retry_prompt,
-                    system=SYSTEM_PROMPT,
-                    temperature=0.7,
-                )
-            else:
-                raw_response = await llm_client.generate(
-                    prompt=prompt,
-                    system=SYSTEM_PROMPT,
-                    temperature=0.7,
-                )
-            
-            # Extract and parse JSON
-            json_str = extract_json(raw_response)
-            data = json.loads(json_str)
-            
-            # Validate required fields
-            required_fields = ["title", "description", "tables", "setup_sql", "expected_query", "expected_columns", "hints"]
-            missing = [f for f in required_fields if f not in data]
-            if missing:
-                raise ValueError(f"Missing required fields: {missing}")
+                return await _request_question(build_retry_prompt(prompt, last_error))
+            return await _request_question(prompt)
             
-            # Parse tables
-            tables = [
-                TableSchema(
-                    name=t["name"],
-                    columns=t["columns"],
-                    sample_data=t["sample_data"],
-                )
-                for t in data["tables"]
-            ]
-            
-            return Question(
-                title=data["title"],
-                description=data["description"],
-                tables=tables,
-                setup_sql=data["setup_sql"],
-                expected_query=data["expected_query"],
-                expected_columns=data["expected_columns"],
-                hints=data["hints"],
-            )
-            
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             last_error = f"Invalid JSON: {str(e)}"
         except KeyError as e:
             last_error = f"Missing field: {str(e)}"
@@ -214,83 +319,69 @@ Please fix the issue and regenerate. Remember:
     raise ValueError(f"Failed to generate question after {max_retries + 1} attempts. Last error: {last_error}")
 
 
+async def _fill_pool(difficulty: Difficulty, pool: asyncio.Queue[Question]) -> None:
+    """Keep a difficulty's pool topped up with freshly generated questions."""
+    while True:
+        prompt = build_prompt(difficulty.value, random.choice(DOMAINS))
+        try:
+            question = await _generate_fresh(prompt)
+        except Exception:
+            # Most likely Ollama is down; back off before trying again
+            await asyncio.sleep(PREWARM_RETRY_DELAY_SECONDS)
+            continue
+        # Blocks while the pool is full
+        await pool.put(question)
+
+
+def start_question_prewarm() -> list[asyncio.Task]:
+    """
+    Start background generators that pre-fill a question pool per difficulty.
+    
+    Does nothing unless settings.question_pool_size > 0. Returns the tasks so
+    the caller can cancel them on shutdown.
+    """
+    if settings.question_pool_size <= 0:
+        return []
+    
+    tasks = []
+    for difficulty in Difficulty:
+        pool: asyncio.Queue[Question] = asyncio.Queue(maxsize=settings.question_pool_size)
+        _pools[difficulty] = pool
+        tasks.append(asyncio.create_task(_fill_pool(difficulty, pool)))
+    return tasks
+
+
+async def generate_questions_batch(
+    specs: list[tuple[Difficulty, str | None]],
+    concurrency: int = 8,
+) -> list[Question | BaseException]:
+    """
+    Generate several questions concurrently.
+    
+    Args:
+        specs: (difficulty, domain) pairs, one per question
+        concurrency: Maximum generations in flight at once
+    
+    Returns:
+        One entry per spec, in order: the Question, or the exception raised
+        for that spec
+    """
+    sem = asyncio.Semaphore(concurrency)
+    
+    # Retries happen inside generate_question, so each spec holds one slot
+    async def _one(spec: tuple[Difficulty, str | None]) -> Question:
+        async with sem:
+            return await generate_question(*spec)
+    
+    return await asyncio.gather(*(_one(spec) for spec in specs), return_exceptions=True)
+
+
 async def generate_custom_question(
     user_prompt: str,
     max_retries: int = 2,
 ) -> Question:
     """Generate a practice question using the LLM from a natural-language request."""
-    prompt = build_custom_prompt(user_prompt)
-
-    last_error: str | None = None
-
-    for attempt in range(max_retries + 1):
-        try:
-            if attempt > 0 and last_error:
-                retry_prompt = f"""The previous attempt had an error: {last_error}
-
-Please fix the issue and regenerate. Remember:
-- Output ONLY valid JSON
-- Ensure all SQL statements are valid PostgreSQL 14
-- Make sure expected_query actually works with the setup_sql schema
-
-{prompt}"""
-                raw_response = await llm_client.generate(
-                    prompt=retry_prompt,
-                    system=SYSTEM_PROMPT,
-                    temperature=0.7,
-                )
-            else:
-                raw_response = await llm_client.generate(
-                    prompt=prompt,
-                    system=SYSTEM_PROMPT,
-                    temperature=0.7,
-                )
-
-            json_str = extract_json(raw_response)
-            data = json.loads(json_str)
-
-            required_fields = [
-                "title",
-                "description",
-                "tables",
-                "setup_sql",
-                "expected_query",
-                "expected_columns",
-                "hints",
-            ]
-            missing = [f for f in required_fields if f not in data]
-            if missing:
-                raise ValueError(f"Missing required fields: {missing}")
-
-            tables = [
-                TableSchema(
-                    name=t["name"],
-                    columns=t["columns"],
-                    sample_data=t["sample_data"],
-                )
-                for t in data["tables"]
-            ]
-
-            return Question(
-                title=data["title"],
-                description=data["description"],
-                tables=tables,
-                setup_sql=data["setup_sql"],
-                expected_query=data["expected_query"],
-                expected_columns=data["expected_columns"],
-                hints=data["hints"],
-            )
-
-        except json.JSONDecodeError as e:
-            last_error = f"Invalid JSON: {str(e)}"
-        except KeyError as e:
-            last_error = f"Missing field: {str(e)}"
-        except Exception as e:
-            last_error = str(e)
-
-    raise ValueError(
-        f"Failed to generate question after {max_retries + 1} attempts. Last error: {last_error}"
-    )
+    return await _generate_fresh(build_custom_prompt(user_prompt), max_retries)
 
 
 def generate_schema_name() -> str:
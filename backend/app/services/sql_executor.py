@@ -1,7 +1,12 @@
 import asyncio
 import re
 import time
-from typing import Any
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable
+from uuid import UUID
 
 import asyncpg
 
@@ -11,7 +16,13 @@ from app.models.schemas import SQLExecuteResponse
 settings = get_settings()
 
 # Valid schema name pattern: practice_ followed by 8 hex characters
-SCHEMA_NAME_PATTERN = re.compile(r"^practice_[a-f0-9]{8}$")
+SCHEMA_NAME_PATTERN = re.compile(r"practice_[a-f0-9]{8}")
+
+# Queries whose row limit can be pushed into Postgres via a LIMIT subquery
+SELECT_PATTERN = re.compile(r"\s*(?:WITH|SELECT)\b", re.IGNORECASE)
+
+# Results larger than this are returned column-major when columnar=True
+COLUMNAR_ROW_THRESHOLD = 100
 
 
 def validate_schema_name(schema_name: str) -> bool:
@@ -19,7 +30,31 @@ def validate_schema_name(schema_name: str) -> bool:
     Validate that a schema name matches the expected pattern.
     Prevents SQL injection via malicious schema names.
     """
-    return bool(SCHEMA_NAME_PATTERN.match(schema_name))
+    return SCHEMA_NAME_PATTERN.fullmatch(schema_name) is not None
+
+
+def quote_ident(name: str) -> str:
+    """Quote a SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+@lru_cache(maxsize=1024)
+def _schema_ddl(schema_name: str) -> tuple[str, str, str]:
+    """
+    Build the statements used to set up and query a practice schema.
+    
+    Returns (CREATE SCHEMA, setup search_path, query search_path). Setup SQL
+    runs with only the practice schema on its search_path, so unqualified
+    names in generated DROP/ALTER/INSERT statements can never reach public.
+    
+    Cached since a session reuses the same schema for every query.
+    """
+    quoted = quote_ident(schema_name)
+    return (
+        f"CREATE SCHEMA IF NOT EXISTS {quoted}",
+        f"SET search_path TO {quoted}",
+        f"SET search_path TO {quoted}, public",
+    )
 
 
 async def execute_query(
@@ -28,6 +63,7 @@ async def execute_query(
     schema_name: str | None = None,
     limit: int | None = None,
     timeout: float | None = None,
+    columnar: bool = False,
 ) -> SQLExecuteResponse:
     """
     Execute a SQL query and return structured results.
@@ -38,6 +74,7 @@ async def execute_query(
         schema_name: Optional schema to set search_path to
         limit: Maximum rows to return (defaults to settings.max_query_rows)
         timeout: Query timeout in seconds (defaults to settings.max_query_timeout_seconds)
+        columnar: Return large results in column_data instead of rows
     
     Returns:
         SQLExecuteResponse with results or error
@@ -55,14 +92,16 @@ async def execute_query(
                     success=False,
                     error="Invalid schema name format"
                 )
-            await conn.execute(f"SET search_path TO {schema_name}, public")
+            # This stays its own round trip: fetch() uses the extended protocol,
+            # which cannot carry a second statement, and SET LOCAL would need an
+            # explicit transaction (two more round trips). Repeat queries still
+            # save a round trip through asyncpg's per-connection statement cache.
+            _, _, set_search_path = _schema_ddl(schema_name)
+            await conn.execute(set_search_path)
         
         # Execute with timeout
         try:
-            records = await asyncio.wait_for(
-                conn.fetch(query),
-                timeout=timeout
-            )
+            records, limited = await _fetch(conn, query, limit, timeout)
         except asyncio.TimeoutError:
             return SQLExecuteResponse(
                 success=False,
@@ -85,13 +124,31 @@ async def execute_query(
         # Extract column names from first record
         columns = list(records[0].keys())
         
-        # Convert records to list of lists, applying limit
-        total_rows = len(records)
-        truncated = total_rows > limit
-        rows = [
-            [_serialize_value(record[col]) for col in columns]
-            for record in records[:limit]
-        ]
+        # Convert records to list of lists, applying limit. When the limit was
+        # pushed into the query the total is unknown, so report rows returned.
+        truncated = len(records) > limit
+        total_rows = min(len(records), limit) if limited else len(records)
+        # A column has one Postgres type, so the first record shows whether
+        # any cell can need converting. Records iterate positionally in
+        # column order; avoid per-cell name lookups.
+        if all(type(value) in _NATIVE_TYPES for value in records[0]):
+            rows = [list(record) for record in islice(records, limit)]
+        else:
+            serialize = _serialize_value
+            rows = [
+                [serialize(value) for value in record]
+                for record in islice(records, limit)
+            ]
+        
+        if columnar and len(rows) > COLUMNAR_ROW_THRESHOLD:
+            return SQLExecuteResponse(
+                success=True,
+                columns=columns,
+                column_data=[list(col) for col in zip(*rows)],
+                row_count=total_rows,
+                truncated=truncated,
+                execution_time_ms=execution_time
+            )
         
         return SQLExecuteResponse(
             success=True,
@@ -118,17 +175,92 @@ async def execute_query(
         )
 
 
+async def _fetch(
+    conn: asyncpg.Connection,
+    query: str,
+    limit: int,
+    timeout: float,
+) -> tuple[list[asyncpg.Record], bool]:
+    """
+    Fetch records, pushing the row limit into Postgres for SELECT queries.
+    
+    Returns:
+        Tuple of (records, limited) where limited means at most limit + 1
+        records were fetched
+    """
+    if SELECT_PATTERN.match(query):
+        # Newlines keep a trailing "-- comment" from swallowing the paren
+        wrapped = f"SELECT * FROM (\n{query.strip().rstrip(';')}\n) AS _aide_limited LIMIT {limit + 1}"
+        try:
+            records = await asyncio.wait_for(conn.fetch(wrapped), timeout=timeout)
+            return records, True
+        except (asyncpg.PostgresSyntaxError, asyncpg.FeatureNotSupportedError):
+            # Not valid as a subquery (e.g. SELECT INTO, data-modifying CTE)
+            pass
+    
+    records = await asyncio.wait_for(conn.fetch(query), timeout=timeout)
+    return records, False
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _serialize_list(value: list | tuple) -> list:
+    return [_serialize_value(v) for v in value]
+
+
+def _serialize_dict(value: dict) -> dict:
+    return {k: _serialize_value(v) for k, v in value.items()}
+
+
+def _serialize_bytes(value: bytes | memoryview) -> str:
+    # Same \x hex form psql uses for bytea
+    return "\\x" + value.hex()
+
+
+# Types asyncpg returns that are already JSON-serializable. None is left out:
+# a NULL in the first record says nothing about the rest of its column.
+_NATIVE_TYPES = frozenset({int, float, str, bool})
+
+# Serializers keyed on exact type; one dict lookup per cell on the common path
+_SERIALIZERS: dict[type, Callable[[Any], Any]] = {
+    type(None): _identity,
+    int: _identity,
+    float: _identity,
+    str: _identity,
+    bool: _identity,
+    list: _serialize_list,
+    tuple: _serialize_list,
+    dict: _serialize_dict,
+    # Exact text keeps the declared scale (750.50) and one type per column
+    Decimal: str,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    dt_time: dt_time.isoformat,
+    UUID: str,
+    bytes: _serialize_bytes,
+    memoryview: _serialize_bytes,
+}
+
+
 def _serialize_value(value: Any) -> Any:
     """Convert database values to JSON-serializable types."""
-    if value is None:
-        return None
+    serializer = _SERIALIZERS.get(type(value))
+    if serializer is not None:
+        return serializer(value)
+    return _serialize_fallback(value)
+
+
+def _serialize_fallback(value: Any) -> Any:
+    """Handle subclasses and types without an exact-type serializer."""
     if isinstance(value, (int, float, str, bool)):
         return value
     if isinstance(value, (list, tuple)):
-        return [_serialize_value(v) for v in value]
+        return _serialize_list(value)
     if isinstance(value, dict):
-        return {k: _serialize_value(v) for k, v in value.items()}
-    # Handle dates, times, decimals, etc.
+        return _serialize_dict(value)
+    # Handle intervals, ranges, network types, etc.
     return str(value)
 
 
@@ -148,12 +280,12 @@ async def execute_setup_sql(
         return False, "Invalid schema name format"
     
     try:
-        # Create schema if it doesn't exist
-        await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
-        await conn.execute(f"SET search_path TO {schema_name}")
-        
-        # Execute setup statements
-        await conn.execute(setup_sql)
+        # Create the schema, point search_path at it and run the setup
+        # statements as one batch. Without arguments asyncpg uses the simple
+        # query protocol, so this is a single round trip and Postgres runs the
+        # whole batch in one implicit transaction.
+        create_schema, set_search_path, _ = _schema_ddl(schema_name)
+        await conn.execute(f"{create_schema};\n{set_search_path};\n{setup_sql}")
         
         return True, None
     except asyncpg.PostgresError as e:
@@ -5,97 +5,125 @@ Cleanup script for old practice schemas.
 Run manually or via cron:
     python cleanup.py --max-age-hours 2
 
-Or as a module:
+Or as a module (uses the app's connection pool unless one is passed):
     from cleanup import cleanup_old_schemas
     await cleanup_old_schemas(max_age_hours=2)
 """
 
 import asyncio
 import argparse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 import asyncpg
 
 from app.config import get_settings
+from app.database import create_pool
+from app.services.sql_executor import quote_ident, validate_schema_name
 
 settings = get_settings()
 
+# Schemas dropped concurrently, each on its own pooled connection
+DROP_CONCURRENCY = 8
 
-async def cleanup_old_schemas(max_age_hours: int = 2) -> list[str]:
+# Connections used when run from the command line
+CLI_POOL_SIZE = 8
+
+
+async def _drop_schemas(pool: asyncpg.Pool, names: list[str]) -> list[str]:
+    """
+    Drop schemas concurrently across pool connections.
+    
+    Failures are logged and skipped so one bad schema doesn't stop the rest.
+    
+    Args:
+        pool: Connection pool to drop on
+        names: Validated schema names to drop
+    
+    Returns:
+        List of schema names that were dropped
+    """
+    sem = asyncio.Semaphore(DROP_CONCURRENCY)
+    
+    async def _drop(name: str) -> str:
+        async with sem, pool.acquire() as conn:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {quote_ident(name)} CASCADE")
+        print(f"Dropped schema: {name}")
+        return name
+    
+    results = await asyncio.gather(*(_drop(name) for name in names), return_exceptions=True)
+    
+    dropped: list[str] = []
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            print(f"Failed to drop schema {name}: {result}")
+        else:
+            dropped.append(result)
+    return dropped
+
+
+async def cleanup_old_schemas(
+    max_age_hours: int = 2,
+    pool: asyncpg.Pool | None = None,
+) -> list[str]:
     """
     Remove practice schemas older than max_age_hours.
     
     Args:
         max_age_hours: Maximum age in hours before cleanup
+        pool: Connection pool to use (defaults to the app's shared pool)
     
     Returns:
         List of dropped schema names
     """
-    conn = await asyncpg.connect(dsn=settings.database_url)
-    dropped: list[str] = []
+    pool = pool or await create_pool()
+    to_drop: list[str] = []
     
-    try:
-        # Find all practice schemas
+    async with pool.acquire() as conn:
+        # Fetch every practice schema with its oldest table file and table
+        # count in one query, instead of probing each schema separately.
+        # Note: This is approximate - PostgreSQL doesn't track schema creation time directly
         schemas = await conn.fetch("""
-            SELECT schema_name 
-            FROM information_schema.schemata 
-            WHERE schema_name LIKE 'practice_%'
+            SELECT n.nspname AS schema_name,
+                   MIN((pg_stat_file(pg_relation_filepath(c.oid), true)).modification) AS oldest_table,
+                   COUNT(c.oid) AS table_count
+            FROM pg_namespace n
+            LEFT JOIN pg_class c ON c.relnamespace = n.oid AND c.relkind = 'r'
+            WHERE n.nspname LIKE 'practice\\_%'
+            GROUP BY n.nspname
         """)
         
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+        
         for record in schemas:
             schema_name = record["schema_name"]
+            if not validate_schema_name(schema_name):
+                continue
             
-            # Check schema age via any table's creation time
-            # Note: This is approximate - PostgreSQL doesn't track schema creation time directly
-            age_query = await conn.fetchrow(f"""
-                SELECT MIN(
-                    (SELECT create_date FROM pg_stat_file(
-                        pg_relation_filepath(c.oid)
-                    ))
-                ) as oldest_table
-                FROM pg_class c
-                JOIN pg_namespace n ON c.relnamespace = n.oid
-                WHERE n.nspname = $1 AND c.relkind = 'r'
-            """, schema_name)
-            
-            # If we can't determine age or schema is old enough, drop it
-            should_drop = False
-            
-            if age_query and age_query["oldest_table"]:
-                age = datetime.now() - age_query["oldest_table"]
-                should_drop = age > timedelta(hours=max_age_hours)
+            # If we can't determine age, only drop empty schemas
+            if record["oldest_table"]:
+                should_drop = record["oldest_table"] < cutoff
             else:
-                # Can't determine age, check if schema has any tables
-                table_count = await conn.fetchval(f"""
-                    SELECT COUNT(*) 
-                    FROM information_schema.tables 
-                    WHERE table_schema = $1
-                """, schema_name)
-                # Empty schemas are safe to drop
-                should_drop = table_count == 0
+                should_drop = record["table_count"] == 0
             
             if should_drop:
-                await conn.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
-                dropped.append(schema_name)
-                print(f"Dropped schema: {schema_name}")
+                to_drop.append(schema_name)
     
-    finally:
-        await conn.close()
-    
-    return dropped
+    return await _drop_schemas(pool, to_drop)
 
 
-async def cleanup_with_metadata_table(max_age_hours: int = 2) -> list[str]:
+async def cleanup_with_metadata_table(
+    max_age_hours: int = 2,
+    pool: asyncpg.Pool | None = None,
+) -> list[str]:
     """
     Alternative cleanup using a metadata table for tracking.
     
     This is more reliable than filesystem-based age detection.
     Requires the aide_practice_meta table to exist.
     """
-    conn = await asyncpg.connect(dsn=settings.database_url)
-    dropped: list[str] = []
+    pool = pool or await create_pool()
     
-    try:
+    async with pool.acquire() as conn:
         # Create metadata table if it doesn't exist
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS public.aide_practice_meta (
@@ -112,16 +140,17 @@ async def cleanup_with_metadata_table(max_age_hours: int = 2) -> list[str]:
             FROM public.aide_practice_meta 
             WHERE created_at < $1
         """, cutoff)
-        
-        for record in old_schemas:
-            schema_name = record["schema_name"]
-            await conn.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
-            await conn.execute("""
-                DELETE FROM public.aide_practice_meta 
-                WHERE schema_name = $1
-            """, schema_name)
-            dropped.append(schema_name)
-            print(f"Dropped schema: {schema_name}")
+    
+    dropped = await _drop_schemas(pool, [
+        record["schema_name"] for record in old_schemas
+        if validate_schema_name(record["schema_name"])
+    ])
+    
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            DELETE FROM public.aide_practice_meta 
+            WHERE schema_name = ANY($1::text[])
+        """, dropped)
         
         # Also clean up orphaned metadata (schemas that no longer exist)
         await conn.execute("""
@@ -132,12 +161,24 @@ async def cleanup_with_metadata_table(max_age_hours: int = 2) -> list[str]:
             )
         """)
     
-    finally:
-        await conn.close()
-    
     return dropped
 
 
+async def _run(args: argparse.Namespace) -> list[str]:
+    """Run a cleanup with a small dedicated pool for the CLI."""
+    pool = await asyncpg.create_pool(
+        dsn=settings.database_url,
+        min_size=1,
+        max_size=CLI_POOL_SIZE,
+    )
+    try:
+        if args.use_metadata:
+            return await cleanup_with_metadata_table(args.max_age_hours, pool=pool)
+        return await cleanup_old_schemas(args.max_age_hours, pool=pool)
+    finally:
+        await pool.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Clean up old practice schemas")
     parser.add_argument(
@@ -153,11 +194,7 @@ def main():
     )
     
     args = parser.parse_args()
-    
-    if args.use_metadata:
-        dropped = asyncio.run(cleanup_with_metadata_table(args.max_age_hours))
-    else:
-        dropped = asyncio.run(cleanup_old_schemas(args.max_age_hours))
+    dropped = asyncio.run(_run(args))
     
     print(f"Cleanup complete. Dropped {len(dropped)} schemas.")
 
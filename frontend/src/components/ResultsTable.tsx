@@ -42,12 +42,20 @@ export function ResultsTable({ result, isLoading }: ResultsTableProps) {
     );
   }
 
+  const columnData = result.column_data;
+  const rows = columnData
+    ? Array.from({ length: columnData[0]?.length ?? 0 }, (_, rowIdx) =>
+        columnData.map((col) => col[rowIdx])
+      )
+    : result.rows;
+
   return (
     <div className="results-container">
       <div className="results-meta">
         <span>
-          {result.row_count} row{result.row_count !== 1 ? 's' : ''}
-          {result.truncated && ` (showing first ${result.rows.length})`}
+          {result.truncated
+            ? `Showing first ${rows.length} rows (result truncated)`
+            : `${result.row_count} row${result.row_count !== 1 ? 's' : ''}`}
         </span>
         <span>{result.execution_time_ms.toFixed(1)}ms</span>
       </div>
@@ -62,7 +70,7 @@ export function ResultsTable({ result, isLoading }: ResultsTableProps) {
             </tr>
           </thead>
           <tbody>
-            {result.rows.map((row, rowIdx) => (
+            {rows.map((row, rowIdx) => (
               <tr key={rowIdx}>
                 {row.map((cell, cellIdx) => (
                   <td key={cellIdx}>
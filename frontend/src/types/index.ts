@@ -11,6 +11,8 @@ export interface SQLExecuteResponse {
   success: boolean;
   columns: string[];
   rows: unknown[][];
+  /** Column-major results (one array per column); when present, rows is empty */
+  column_data?: unknown[][] | null;
   row_count: number;
   truncated: boolean;
   error: string | null;